@@ -0,0 +1,255 @@
+import asyncio
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import requests
+
+
+class Backend:
+    """One remote chat-completion endpoint with rolling health statistics"""
+
+    def __init__(self, name: str, url: str, model: str, window: int = 50):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        # Any answer proves the backend is up, so this also closes an open
+        # circuit, even when it comes from a hedge the caller stopped waiting for
+        with self._lock:
+            self.latencies.append(latency)
+            self.outcomes.append(True)
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self, failure_threshold: int):
+        with self._lock:
+            self.outcomes.append(False)
+            self.consecutive_failures += 1
+            self.probing = False
+            if self.consecutive_failures >= failure_threshold:
+                # (Re)open the circuit; a failed half-open trial lands here too
+                self.opened_at = time.time()
+
+    def release_probe(self):
+        with self._lock:
+            self.probing = False
+
+    def try_acquire(self, cooldown: float) -> bool:
+        """Whether a request may be sent now; half-open allows a single probe"""
+        with self._lock:
+            state = self.circuit_state(cooldown)
+            if state == "closed":
+                return True
+            if state == "open" or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def circuit_state(self, cooldown: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at < cooldown:
+            return "open"
+        return "half_open"
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LLMRouter:
+    """Route completions across configured backends with hedging and circuit breakers.
+
+    Backends are ranked by rolling error rate, then p95 latency, and the best
+    gets the request. If it has not answered by its p95, the next one is raced
+    against it. Local generation is the final hedge: once the last backend
+    passes its p95 too, complete() returns None and the caller uses the local
+    engine. Backends that fail repeatedly are skipped until a cooldown passes.
+    """
+
+    def __init__(self):
+        url = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+        models = os.getenv("OPENROUTER_MODELS", "arcee-ai/trinity-large-preview:free")
+        self.backends: List[Backend] = [
+            Backend(model, url, model) for model in (m.strip() for m in models.split(",")) if model
+        ]
+        self.timeout = float(os.getenv("AI_TIMEOUT", "30"))
+        self.hedge_min = float(os.getenv("AI_HEDGE_MIN", "2"))
+        self.hedge_default = float(os.getenv("AI_HEDGE_DEFAULT", "10"))
+        self.failure_threshold = int(os.getenv("AI_CIRCUIT_FAILURES", "3"))
+        self.cooldown = float(os.getenv("AI_CIRCUIT_COOLDOWN", "60"))
+        self.decisions = Counter()
+        # Losing hedged calls can't be cancelled mid-request, so they run in a
+        # bounded pool of their own instead of the loop's default executor
+        per_backend = int(os.getenv("AI_MAX_CONCURRENCY_PER_BACKEND", "4"))
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, len(self.backends) * per_backend),
+            thread_name_prefix="llm-router",
+        )
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """Time to wait for a backend before racing the next one"""
+        p95 = backend.percentile(0.95) if len(backend.latencies) >= 5 else None
+        delay = self.hedge_default if p95 is None else p95
+        return max(self.hedge_min, min(delay, self.timeout))
+
+    def rank(self, backend: Backend):
+        """Sort key for choosing backends: least errors first, then fastest"""
+        return (round(backend.error_rate(), 2), self.hedge_delay(backend))
+
+    async def complete(self, prompt: str) -> Optional[str]:
+        api_key = os.getenv("OPENROUTER_API_KEY")
+        if not api_key:
+            self.decisions["local:no_api_key"] += 1
+            return None
+
+        candidates = []
+        for backend in self.backends:
+            if backend.circuit_state(self.cooldown) == "open":
+                self.decisions[f"skip_open_circuit:{backend.name}"] += 1
+            else:
+                candidates.append(backend)
+        if not candidates:
+            self.decisions["local:all_circuits_open"] += 1
+            return None
+        # Stable, so backends without statistics keep their configured order
+        candidates.sort(key=self.rank)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        pending = set()
+        current = None
+        launched_at = 0.0
+
+        def launch(kind: str) -> bool:
+            nonlocal current, launched_at
+            while candidates:
+                backend = candidates.pop(0)
+                if not backend.try_acquire(self.cooldown):
+                    self.decisions[f"skip_probe_in_flight:{backend.name}"] += 1
+                    continue
+                current = backend
+                launched_at = loop.time()
+                self.decisions[f"{kind}:{backend.name}"] += 1
+                pending.add(asyncio.ensure_future(self._call(backend, prompt, api_key)))
+                return True
+            return False
+
+        if not launch("primary"):
+            self.decisions["local:all_circuits_open"] += 1
+            return None
+        try:
+            while pending:
+                now = loop.time()
+                if now >= deadline:
+                    break
+                hedge_at = min(launched_at + self.hedge_delay(current), deadline)
+
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(hedge_at - now, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name, content = task.result()
+                    if content:
+                        self.decisions[f"winner:{name}"] += 1
+                        return content
+
+                if not pending:
+                    if not launch("failover"):
+                        break
+                elif not done and loop.time() < deadline and not launch("hedge"):
+                    # The last backend is past its p95 as well; stop waiting
+                    # and let the local engine answer
+                    self.decisions["local:hedge"] += 1
+                    return None
+        finally:
+            # Calls still queued for a worker are dropped; ones already
+            # running can't be interrupted and record their own outcome
+            for task in pending:
+                task.cancel()
+
+        self.decisions["local:exhausted"] += 1
+        return None
+
+    async def _call(self, backend: Backend, prompt: str, api_key: str):
+        future = self.executor.submit(self._timed_post, backend, prompt, api_key)
+
+        def record(done):
+            # Runs even if the caller stopped waiting, so losing hedges still
+            # feed the statistics and a half-open probe is always released
+            if done.cancelled():
+                backend.release_probe()
+                return
+            content, latency = done.result()
+            if content:
+                backend.record_success(latency)
+            else:
+                backend.record_failure(self.failure_threshold)
+
+        future.add_done_callback(record)
+        content, _ = await asyncio.wrap_future(future)
+        return backend.name, content
+
+    def _timed_post(self, backend: Backend, prompt: str, api_key: str):
+        start = time.monotonic()
+        try:
+            content = self._post(backend, prompt, api_key)
+        except Exception as e:
+            print(f"OpenRouter backend {backend.name} failed: {e}")
+            content = None
+        return content, time.monotonic() - start
+
+    def _post(self, backend: Backend, prompt: str, api_key: str) -> Optional[str]:
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": backend.model,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+        response = requests.post(backend.url, headers=headers, json=data, timeout=self.timeout)
+        if response.status_code == 200:
+            result = response.json()
+            return result['choices'][0]['message']['content']
+        print(f"OpenRouter error from {backend.name}: {response.status_code}")
+        return None
+
+    def metrics(self) -> dict:
+        return {
+            "decisions": dict(self.decisions),
+            "backends": [
+                {
+                    "name": backend.name,
+                    "circuit": backend.circuit_state(self.cooldown),
+                    "consecutive_failures": backend.consecutive_failures,
+                    "error_rate": round(backend.error_rate(), 3),
+                    "p50_latency": backend.percentile(0.5),
+                    "p95_latency": backend.percentile(0.95),
+                    "hedge_delay": self.hedge_delay(backend),
+                    "samples": len(backend.outcomes),
+                }
+                for backend in self.backends
+            ],
+        }
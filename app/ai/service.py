@@ -1,12 +1,14 @@
 import os
 from typing import List
 import re
-import requests
+
+from .router import LLMRouter
 
 class AIService:
     def __init__(self):
         print("AI Service initialized with OpenRouter Trinity model + enhanced fallback")
         self.use_ai = True
+        self.router = LLMRouter()
     
     async def generate_notes(self, text: str) -> str:
         """Generate structured notes using OpenRouter Trinity model with fallback"""
@@ -35,11 +37,7 @@ class AIService:
         return self._enhanced_feedback(notes)
     
     async def _openrouter_notes(self, text: str) -> str:
-        """Generate notes using OpenRouter Trinity model"""
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
-            return None
-            
+        """Generate notes using the routed OpenRouter backends"""
         import re
         clean_text = re.sub(r'--- Page \d+ ---', '', text)
         clean_text = re.sub(r'\n+', '\n', clean_text).strip()
@@ -59,58 +57,21 @@ Content:
 
 Create well-structured study notes with proper headings and full paragraphs."""
         
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "arcee-ai/trinity-large-preview:free",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        if response.status_code == 200:
-            result = response.json()
-            return result['choices'][0]['message']['content']
-        else:
-            print(f"OpenRouter error: {response.status_code}")
-            return None
+        return await self.router.complete(prompt)
     
     async def _openrouter_feedback(self, notes: str) -> List[str]:
-        """Get feedback using OpenRouter Trinity model"""
-        api_key = os.getenv("OPENROUTER_API_KEY")
-        if not api_key:
-            return None
-            
+        """Get feedback using the routed OpenRouter backends"""
         prompt = f"""Review this presentation content and give 3-5 specific feedback points:
 
 {notes}
 
 Focus on: slide length, clarity, structure, best practices."""
         
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "arcee-ai/trinity-large-preview:free",
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        }
-        
-        response = requests.post(url, headers=headers, json=data, timeout=30)
-        if response.status_code == 200:
-            result = response.json()
-            feedback_text = result['choices'][0]['message']['content']
-            feedback = feedback_text.split('\n')
-            return [f.strip() for f in feedback if f.strip()][:10]
-        else:
+        feedback_text = await self.router.complete(prompt)
+        if not feedback_text:
             return None
+        feedback = feedback_text.split('\n')
+        return [f.strip() for f in feedback if f.strip()][:10]
     
     def _enhanced_notes(self, text: str) -> str:
         """Enhanced notes generation with better structure"""
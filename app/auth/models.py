@@ -33,6 +33,10 @@ class Presentation(BaseModel):
     title: str
     notes: Optional[str] = None
     pdf_filename: Optional[str] = None
+    pdf_path: Optional[str] = None
+    ppt_path: Optional[str] = None
+    text_pack: Optional[str] = None
+    notes_pack: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 async def get_database():
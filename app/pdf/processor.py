@@ -1,10 +1,15 @@
 import PyPDF2
 import pdfplumber
 import re
+from typing import Dict
 
 class PDFProcessor:
     def extract_text(self, file_path: str, pages: str = "all"):
         """Extract text from PDF pages. Pages can be 'all', '1-3', '1,3,5', etc."""
+        return self.join_pages(self.extract_pages(file_path, pages))
+    
+    def extract_pages(self, file_path: str, pages: str = "all") -> Dict[int, str]:
+        """Extract text per page, keyed by 1-based page number. Pages without text are skipped."""
         try:
             with open(file_path, 'rb') as file:
                 pdf_reader = PyPDF2.PdfReader(file)
@@ -13,7 +18,7 @@ class PDFProcessor:
                 # Parse page specification
                 page_numbers = self._parse_pages(pages, total_pages)
                 
-                extracted_text = ""
+                extracted_pages = {}
                 
                 # Use pdfplumber for better text extraction
                 with pdfplumber.open(file_path) as pdf:
@@ -22,13 +27,29 @@ class PDFProcessor:
                             page = pdf.pages[page_num]
                             text = page.extract_text()
                             if text:
-                                extracted_text += f"\n--- Page {page_num + 1} ---\n{text}\n"
+                                extracted_pages[page_num + 1] = text
                 
-                return extracted_text.strip()
+                return extracted_pages
                 
         except Exception as e:
             raise Exception(f"Error processing PDF: {str(e)}")
     
+    def join_pages(self, extracted_pages: Dict[int, str]) -> str:
+        """Combine per-page text into one string with page markers"""
+        extracted_text = ""
+        for page_number in sorted(extracted_pages):
+            extracted_text += f"\n--- Page {page_number} ---\n{extracted_pages[page_number]}\n"
+        return extracted_text.strip()
+    
+    def count_pages(self, source, pages: str = "all") -> int:
+        """Count the pages a page specification selects. Source is a path or file object."""
+        try:
+            total_pages = len(PyPDF2.PdfReader(source).pages)
+            page_numbers = self._parse_pages(pages, total_pages)
+            return len([n for n in page_numbers if 0 <= n < total_pages])
+        except Exception as e:
+            raise Exception(f"Error processing PDF: {str(e)}")
+    
     def _parse_pages(self, pages: str, total_pages: int):
         """Parse page specification into list of page numbers (0-indexed)"""
         if pages.lower() == "all":
@@ -6,8 +6,13 @@ from pptx.enum.text import MSO_ANCHOR
 import re
 import os
 
+from app.state.files import atomic_path
+
 class PPTGenerator:
-    def create_presentation(self, notes: str, user_id: int) -> str:
+    TITLE_TEXT = "Generated Presentation"
+    SUBTITLE_TEXT = "Created with Doc2Deck"
+    
+    def create_presentation(self, notes: str, presentation_id: str) -> str:
         """Convert notes into a styled PowerPoint presentation"""
         prs = Presentation()
         
@@ -22,8 +27,9 @@ class PPTGenerator:
             self._create_content_slide(prs, slide_content)
         
         # Save presentation
-        output_path = f"uploads/presentation_{user_id}.pptx"
-        prs.save(output_path)
+        output_path = f"uploads/presentation_{presentation_id}.pptx"
+        with atomic_path(output_path) as tmp_path:
+            prs.save(tmp_path)
         
         return output_path
     
@@ -34,7 +40,7 @@ class PPTGenerator:
         
         # Style title
         title = slide.shapes.title
-        title.text = "Generated Presentation"
+        title.text = self.TITLE_TEXT
         title_paragraph = title.text_frame.paragraphs[0]
         title_paragraph.font.size = Pt(44)
         title_paragraph.font.bold = True
@@ -43,7 +49,7 @@ class PPTGenerator:
         
         # Style subtitle
         subtitle = slide.placeholders[1]
-        subtitle.text = "Created with Doc2Deck"
+        subtitle.text = self.SUBTITLE_TEXT
         subtitle_paragraph = subtitle.text_frame.paragraphs[0]
         subtitle_paragraph.font.size = Pt(24)
         subtitle_paragraph.font.color.rgb = RGBColor(68, 114, 196)  # Light blue
@@ -138,7 +144,7 @@ class PPTGenerator:
         text_frame.margin_left = Inches(0.5)
         text_frame.margin_top = Inches(0.3)
         
-        for i, content_item in enumerate(slide_content["content"]):
+        for i, paragraph in enumerate(self._content_paragraphs(slide_content["content"])):
             if i == 0:
                 # First content item
                 p = text_frame.paragraphs[0]
@@ -146,35 +152,42 @@ class PPTGenerator:
                 # Additional content items
                 p = text_frame.add_paragraph()
             
+            p.text = paragraph["text"]
+            p.level = 0
+            p.font.size = Pt(paragraph["size"])
+            p.font.color.rgb = RGBColor(*paragraph["color"])
+            p.space_after = Pt(paragraph["space_after"])
+    
+    def _content_paragraphs(self, content):
+        """Lay out slide content as styled paragraphs (text, size, color, space_after)"""
+        paragraphs = []
+        for content_item in content:
             # Style content based on type
             if len(content_item) < 100 and not '. ' in content_item:
                 # Short bullet point
-                p.text = content_item
-                p.level = 0
-                p.font.size = Pt(20)
-                p.font.color.rgb = RGBColor(68, 114, 196)  # Medium blue
-                p.space_after = Pt(12)
+                paragraphs.append({"text": content_item, "size": 20, "color": (68, 114, 196), "space_after": 12})  # Medium blue
+            elif len(content_item) > 200:
+                # Split long paragraphs
+                sentences = content_item.split('. ')
+                for sentence in sentences[:3]:
+                    text = sentence + ('.' if not sentence.endswith('.') else '')
+                    paragraphs.append({"text": text, "size": 18, "color": (89, 89, 89), "space_after": 8})  # Dark gray
             else:
                 # Longer paragraph
-                if len(content_item) > 200:
-                    # Split long paragraphs
-                    sentences = content_item.split('. ')
-                    for j, sentence in enumerate(sentences[:3]):
-                        if j == 0:
-                            p.text = sentence + ('.' if not sentence.endswith('.') else '')
-                            p.font.size = Pt(18)
-                            p.font.color.rgb = RGBColor(89, 89, 89)  # Dark gray
-                            p.space_after = Pt(8)
-                        else:
-                            p_new = text_frame.add_paragraph()
-                            p_new.text = sentence + ('.' if not sentence.endswith('.') else '')
-                            p_new.level = 0
-                            p_new.font.size = Pt(18)
-                            p_new.font.color.rgb = RGBColor(89, 89, 89)
-                            p_new.space_after = Pt(8)
-                else:
-                    p.text = content_item
-                    p.level = 0
-                    p.font.size = Pt(18)
-                    p.font.color.rgb = RGBColor(89, 89, 89)  # Dark gray
-                    p.space_after = Pt(10)
\ No newline at end of file
+                paragraphs.append({"text": content_item, "size": 18, "color": (89, 89, 89), "space_after": 10})  # Dark gray
+        return paragraphs
+    
+    def slide_specs(self, notes: str):
+        """Describe every slide create_presentation would produce, for previews"""
+        specs = [{
+            "layout": "title",
+            "title": self.TITLE_TEXT,
+            "subtitle": self.SUBTITLE_TEXT,
+        }]
+        for slide_content in self._parse_notes_to_slides(notes):
+            specs.append({
+                "layout": "content",
+                "title": slide_content["title"] or "Content",
+                "paragraphs": self._content_paragraphs(slide_content["content"]),
+            })
+        return specs
@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageDraw, ImageFont, features
+
+from app.state.files import atomic_write
+from .generator import PPTGenerator
+
+# Bump when the drawing code changes so cached thumbnails are re-rendered
+RENDER_VERSION = "1"
+
+# Default python-pptx slide size is 10in x 7.5in
+SLIDE_WIDTH_IN = 10.0
+SLIDE_HEIGHT_IN = 7.5
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "800"))
+
+# Placeholder boxes of the default template, in inches (left, top, width, height)
+TITLE_SLIDE_TITLE_BOX = (0.75, 2.33, 8.5, 1.61)
+TITLE_SLIDE_SUBTITLE_BOX = (1.5, 4.25, 7.0, 1.75)
+CONTENT_TITLE_BOX = (0.5, 0.3, 9.0, 1.25)
+CONTENT_BODY_BOX = (0.5, 1.75, 9.0, 4.95)
+# Body text frame margins set by PPTGenerator
+CONTENT_MARGIN_LEFT = 0.5
+CONTENT_MARGIN_TOP = 0.3
+
+TITLE_COLOR = (31, 73, 125)
+SUBTITLE_COLOR = (68, 114, 196)
+
+_font_cache = {}
+
+
+def _font(size_px: int, bold: bool = False):
+    key = (size_px, bold)
+    if key not in _font_cache:
+        candidates = [os.getenv("THUMBNAIL_FONT_BOLD" if bold else "THUMBNAIL_FONT")]
+        candidates += ["DejaVuSans-Bold.ttf", "Arial Bold.ttf"] if bold else ["DejaVuSans.ttf", "Arial.ttf"]
+        font = None
+        for name in candidates:
+            if not name:
+                continue
+            try:
+                font = ImageFont.truetype(name, size_px)
+                break
+            except OSError:
+                continue
+        if font is None:
+            try:
+                font = ImageFont.load_default(size=size_px)
+            except TypeError:
+                # Pillow < 10.1 only ships a fixed-size bitmap font
+                font = ImageFont.load_default()
+        _font_cache[key] = font
+    return _font_cache[key]
+
+
+def _wrap(draw: ImageDraw.ImageDraw, text: str, font, width: float) -> List[str]:
+    lines = []
+    for raw_line in text.split('\n'):
+        line = ""
+        for word in raw_line.split():
+            candidate = f"{line} {word}" if line else word
+            if line and draw.textlength(candidate, font=font) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+def render_slide(spec: dict, image_format: str) -> bytes:
+    """Rasterise one slide spec from PPTGenerator.slide_specs"""
+    scale = THUMBNAIL_WIDTH / SLIDE_WIDTH_IN
+    height = int(SLIDE_HEIGHT_IN * scale)
+    image = Image.new("RGB", (THUMBNAIL_WIDTH, height), "white")
+    draw = ImageDraw.Draw(image)
+
+    def px(inches):
+        return inches * scale
+
+    def pt(points):
+        return max(1, int(points / 72.0 * scale))
+
+    def draw_block(box, text, size, color, bold=False, centered=False):
+        left, top, width, box_height = (px(v) for v in box)
+        font = _font(pt(size), bold)
+        line_height = pt(size) * 1.2
+        lines = _wrap(draw, text, font, width)
+        # Title placeholders are vertically centred in their box
+        y = top + max(0, (box_height - line_height * len(lines)) / 2)
+        for line in lines:
+            x = left + (width - draw.textlength(line, font=font)) / 2 if centered else left
+            draw.text((x, y), line, font=font, fill=color)
+            y += line_height
+
+    if spec["layout"] == "title":
+        draw_block(TITLE_SLIDE_TITLE_BOX, spec["title"], 44, TITLE_COLOR, bold=True, centered=True)
+        draw_block(TITLE_SLIDE_SUBTITLE_BOX, spec["subtitle"], 24, SUBTITLE_COLOR, centered=True)
+    else:
+        draw_block(CONTENT_TITLE_BOX, spec["title"], 32, TITLE_COLOR, bold=True, centered=True)
+
+        left, top, width, box_height = CONTENT_BODY_BOX
+        text_left = px(left + CONTENT_MARGIN_LEFT)
+        text_width = px(width - CONTENT_MARGIN_LEFT) - pt(20)
+        bottom = px(top + box_height)
+        y = px(top + CONTENT_MARGIN_TOP)
+        for paragraph in spec["paragraphs"]:
+            font = _font(pt(paragraph["size"]))
+            line_height = pt(paragraph["size"]) * 1.2
+            color = tuple(paragraph["color"])
+            draw.text((text_left, y), "•", font=font, fill=color)
+            for line in _wrap(draw, paragraph["text"], font, text_width):
+                if y + line_height > bottom:
+                    break
+                draw.text((text_left + pt(paragraph["size"]), y), line, font=font, fill=color)
+                y += line_height
+            y += pt(paragraph["space_after"])
+            if y >= bottom:
+                break
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def render_slide_to_file(spec: dict, path: str, image_format: str) -> str:
+    """Pool entry point: render a slide and atomically store it at path"""
+    atomic_write(path, render_slide(spec, image_format))
+    return path
+
+
+class ThumbnailRenderer:
+    """Render slide previews in a background process pool, cached by content hash.
+
+    The cache key covers everything drawn on the slide, so identical slides
+    are rendered once and the hash can be used in long-lived image URLs.
+    """
+
+    def __init__(self, generator: PPTGenerator, cache_dir: str = None):
+        self.generator = generator
+        self.cache_dir = cache_dir or os.getenv("THUMBNAIL_DIR", "uploads/thumbnails")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if features.check("webp"):
+            self.image_format, self.extension, self.media_type = "WEBP", "webp", "image/webp"
+        else:
+            self.image_format, self.extension, self.media_type = "PNG", "png", "image/png"
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._in_flight: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned, not forked: forking a process that runs an event loop
+            # and worker threads can copy locks in a held state
+            self._pool = ProcessPoolExecutor(
+                max_workers=int(os.getenv("THUMBNAIL_WORKERS", "2")),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    def slide_hash(self, spec: dict) -> str:
+        payload = json.dumps(
+            {"v": RENDER_VERSION, "width": THUMBNAIL_WIDTH, "format": self.image_format, "slide": spec},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def path_for(self, slide_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{slide_hash}.{self.extension}")
+
+    def slides(self, notes: str) -> List[dict]:
+        """Slide specs for notes, each tagged with its content hash"""
+        return [
+            {"hash": self.slide_hash(spec), "spec": spec}
+            for spec in self.generator.slide_specs(notes or "")
+        ]
+
+    def _submit(self, slide_hash: str, spec: dict):
+        with self._lock:
+            future = self._in_flight.get(slide_hash)
+            if future is None:
+                future = self.pool.submit(
+                    render_slide_to_file, spec, self.path_for(slide_hash), self.image_format
+                )
+                self._in_flight[slide_hash] = future
+                future.add_done_callback(lambda _: self._forget(slide_hash))
+            return future
+
+    def _forget(self, slide_hash: str):
+        with self._lock:
+            self._in_flight.pop(slide_hash, None)
+
+    def schedule(self, notes: str) -> List[dict]:
+        """Queue rendering of every uncached slide and return the slide list"""
+        slides = self.slides(notes)
+        for slide in slides:
+            if not os.path.exists(self.path_for(slide["hash"])):
+                self._submit(slide["hash"], slide["spec"])
+        return slides
+
+    async def ensure(self, slide_hash: str, spec: dict) -> str:
+        """Return the cached image path, rendering it first if needed"""
+        path = self.path_for(slide_hash)
+        if not os.path.exists(path):
+            await asyncio.wrap_future(self._submit(slide_hash, spec))
+        return path
@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from app.state.store import StateStore, get_state_store
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Per-user token bucket kept in the shared state store.
+
+    Buckets are stored in the state store so every worker draws from the
+    same budget. Cost is measured in work units (pages, chunks of notes).
+    """
+
+    def __init__(self, store: StateStore, capacity: float, refill_per_second: float):
+        self.store = store
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+
+    def _key(self, user_id: str) -> str:
+        return f"ratelimit:{user_id}"
+
+    def _tokens(self, bucket, now: float) -> float:
+        """Tokens available at now, including refill since the last update"""
+        if bucket is None:
+            return self.capacity
+        elapsed = max(0.0, now - bucket["updated"])
+        return min(self.capacity, bucket["tokens"] + elapsed * self.refill_per_second)
+
+    def check(self, user_id: str, cost: float = 1.0):
+        """Raise RateLimitExceeded if cost tokens aren't available, without consuming any.
+
+        A read-only peek for rejecting requests before doing the work needed
+        to price them; the real cost must still be charged with take().
+        """
+        cost = min(cost, self.capacity)
+        tokens = self._tokens(self.store.get(self._key(user_id)), time.time())
+        if tokens < cost:
+            raise RateLimitExceeded((cost - tokens) / self.refill_per_second)
+
+    def take(self, user_id: str, cost: float):
+        """Consume cost tokens or raise RateLimitExceeded"""
+        # A request larger than the whole bucket would otherwise never pass
+        cost = min(cost, self.capacity)
+        outcome = {}
+
+        def refill_and_take(bucket):
+            now = time.time()
+            tokens = self._tokens(bucket, now)
+            if tokens >= cost:
+                tokens -= cost
+                outcome["retry_after"] = None
+            else:
+                outcome["retry_after"] = (cost - tokens) / self.refill_per_second
+            return {"tokens": tokens, "updated": now}
+
+        # Idle buckets refill completely, so they can expire once full again
+        ttl = self.capacity / self.refill_per_second + 60
+        self.store.update(self._key(user_id), refill_and_take, ttl=ttl)
+        if outcome["retry_after"] is not None:
+            raise RateLimitExceeded(outcome["retry_after"])
+
+
+class FairStage:
+    """Concurrency-capped stage that admits waiters by weighted fair queueing.
+
+    Each request gets a virtual finish tag of max(virtual time, the user's
+    previous finish tag) + cost. Free slots go to the smallest tag, so a user
+    with a long queue of expensive jobs cannot starve users with small ones.
+    """
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self.concurrency = concurrency
+        self._active = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._waiters = []
+        self._counter = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, _, future in self._waiters if not future.done())
+
+    def _finish_tag(self, user_id: str, cost: float) -> float:
+        start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish = start + max(cost, 1.0)
+        self._last_finish[user_id] = finish
+        return finish
+
+    async def acquire(self, user_id: str, cost: float):
+        finish = self._finish_tag(user_id, cost)
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+            self._virtual_time = finish - max(cost, 1.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (finish, next(self._counter), max(cost, 1.0), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we were cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        self._active -= 1
+        while self._waiters:
+            finish, _, cost, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._active += 1
+            self._virtual_time = finish - cost
+            future.set_result(None)
+            break
+        else:
+            # Nothing queued: forget users whose tags are already in the past
+            self._last_finish = {
+                user: tag for user, tag in self._last_finish.items() if tag > self._virtual_time
+            }
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, cost: float = 1.0):
+        await self.acquire(user_id, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class Scheduler:
+    """Admission control in front of the expensive upload and generation flows"""
+
+    STAGES = ("extraction", "ai", "rendering")
+
+    def __init__(self, store: Optional[StateStore] = None):
+        burst = float(os.getenv("RATE_LIMIT_BURST", "60"))
+        per_minute = float(os.getenv("RATE_LIMIT_PER_MINUTE", "20"))
+        self.bucket = TokenBucket(store or get_state_store(), burst, per_minute / 60.0)
+        # Caps are per worker process: total concurrency is workers x cap
+        self.stages = {
+            name: FairStage(name, int(os.getenv(f"STAGE_CONCURRENCY_{name.upper()}", "2")))
+            for name in self.STAGES
+        }
+
+    def precheck_budget(self, user_id: str, cost: float = 1.0):
+        """Cheap rejection before the real cost is known; consumes nothing"""
+        self.bucket.check(str(user_id), cost)
+
+    def check_budget(self, user_id: str, cost: float):
+        self.bucket.take(str(user_id), cost)
+
+    def stage(self, name: str, user_id: str, cost: float = 1.0):
+        return self.stages[name].slot(str(user_id), cost)
+
+    @staticmethod
+    def notes_cost(notes: str) -> float:
+        """Estimate the cost of notes-driven work, one unit per ~2000 characters"""
+        return 1.0 + len(notes or "") / 2000.0
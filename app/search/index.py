@@ -0,0 +1,156 @@
+import asyncio
+import html
+import os
+import re
+import sqlite3
+import threading
+from typing import List
+
+from app.storage.textpack import split_notes
+
+# Control characters never appear in notes, so they make safe snippet markers
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+
+# Position of the row holding a presentation's title; sections count from 0
+TITLE_POSITION = -1
+
+
+class SearchIndex:
+    """Full-text index over presentation titles and notes sections (SQLite FTS5).
+
+    Each notes section (text under a # or ## heading) is one row, so hits
+    point at the part of a presentation that matched. The title gets a row of
+    its own at position -1 and is only matched there; section rows carry it
+    for display. The index is kept outside MongoDB and updated whenever notes
+    are created or saved.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv("SEARCH_INDEX_PATH", "state/search_index.db")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS sections USING fts5("
+            "title, heading, body, "
+            "presentation_id UNINDEXED, user_id UNINDEXED, position UNINDEXED, "
+            "tokenize = 'porter unicode61')"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def index_presentation(self, presentation_id: str, user_id: str, title: str, notes: str):
+        """Replace all indexed sections of a presentation"""
+        # Positions count every section, including blank ones that aren't
+        # indexed, so a hit's position can be fed to TextStore.load_notes_section
+        rows = [(title, "", "", str(presentation_id), str(user_id), TITLE_POSITION)]
+        rows += [
+            (title, heading, body, str(presentation_id), str(user_id), position)
+            for position, (heading, body) in enumerate(self._split_sections(notes or ""))
+            if heading or body
+        ]
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM sections WHERE presentation_id = ?", (str(presentation_id),))
+            conn.executemany(
+                "INSERT INTO sections (title, heading, body, presentation_id, user_id, position) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        self._connection().execute("DELETE FROM sections")
+
+    def search(self, user_id: str, query: str, limit: int = 20) -> List[dict]:
+        """Return the user's best matching sections with highlighted snippets"""
+        match = self._build_match(query)
+        if not match:
+            return []
+
+        # Sections match on heading and body, the title row on the title alone,
+        # so a title-only match is one hit rather than one per section
+        rows = self._connection().execute(
+            "SELECT presentation_id, title, heading, position, "
+            "snippet(sections, 2, ?1, ?2, '…', 16), bm25(sections, 5.0, 3.0, 1.0) AS score "
+            "FROM sections WHERE sections MATCH ?3 AND user_id = ?5 AND position >= 0 "
+            "UNION ALL "
+            "SELECT presentation_id, title, heading, position, "
+            "highlight(sections, 0, ?1, ?2), bm25(sections, 5.0, 3.0, 1.0) AS score "
+            "FROM sections WHERE sections MATCH ?4 AND user_id = ?5 AND position = ?6 "
+            "ORDER BY score LIMIT ?7",
+            (
+                _MATCH_START, _MATCH_END,
+                f"{{heading body}} : ({match})", f"title : ({match})",
+                str(user_id), TITLE_POSITION, limit,
+            ),
+        ).fetchall()
+
+        return [
+            {
+                "presentation_id": presentation_id,
+                "title": title,
+                "heading": heading,
+                "section": position,
+                "snippet": self._highlight(snippet),
+                "score": -score,
+            }
+            for presentation_id, title, heading, position, snippet, score in rows
+        ]
+
+    def _split_sections(self, notes: str):
+        """(heading, body) per notes section, positioned exactly like the notes pack"""
+        sections = []
+        for heading, chunk in split_notes(notes):
+            lines = chunk.split('\n')
+            if heading and lines[0].strip().lstrip('#').strip() == heading:
+                lines = lines[1:]
+            sections.append((heading, "\n".join(lines).strip()))
+        return sections
+
+    def _build_match(self, query: str) -> str:
+        """Turn free text into an FTS5 query: all terms required, last one as a prefix"""
+        terms = re.findall(r"\w+", query or "")
+        if not terms:
+            return ""
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def _highlight(self, snippet: str) -> str:
+        escaped = html.escape(snippet or "")
+        return escaped.replace(_MATCH_START, "<mark>").replace(_MATCH_END, "</mark>")
+
+
+async def rebuild_from_database(index: SearchIndex) -> int:
+    """Reindex every stored presentation, e.g. for ones created before the index existed"""
+    from app.auth.models import get_database
+    from app.storage.textpack import TextStore
+
+    db = await get_database()
+    text_store = TextStore()
+    index.clear()
+    count = 0
+    async for doc in db.presentations.find({}, {"user_id": 1, "title": 1, "notes": 1, "notes_pack": 1}):
+        notes = text_store.load_notes(str(doc["_id"])) if doc.get("notes_pack") else doc.get("notes")
+        index.index_presentation(str(doc["_id"]), doc["user_id"], doc.get("title", ""), notes or "")
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    count = asyncio.run(rebuild_from_database(SearchIndex()))
+    print(f"Indexed {count} presentations")
@@ -0,0 +1,176 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+class StateStore:
+    """Key/value store for state that must be shared between workers.
+
+    Values are JSON-serialisable objects. Keys can carry an optional TTL in
+    seconds, after which they read back as missing.
+    """
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def update(self, key: str, func: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """Atomically replace the value of key with func(current) and return it"""
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        return self.update(key, lambda current: (current or 0) + amount, ttl)
+
+
+class MemoryStateStore(StateStore):
+    """Process-local store, only suitable for a single worker"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _read(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._read(key)
+            return default if entry is None else entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def update(self, key: str, func: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        with self._lock:
+            entry = self._read(key)
+            value = func(None if entry is None else entry[0])
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            return value
+
+
+class SQLiteStateStore(StateStore):
+    """Store backed by a local SQLite database in WAL mode.
+
+    Every worker process opens its own connection to the same file, so state
+    written by one worker is immediately visible to the others.
+    """
+
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._last_purge = 0.0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly where needed
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _purge_expired(self, conn: sqlite3.Connection):
+        """Delete expired rows, at most once per PURGE_INTERVAL in this process"""
+        now = time.time()
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+
+    def _read(self, conn: sqlite3.Connection, key: str):
+        row = conn.execute(
+            "SELECT value, expires_at FROM kv WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return json.loads(value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._read(self._connection(), key)
+        return default if value is None else value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        conn = self._connection()
+        self._purge_expired(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl if ttl else None),
+        )
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def update(self, key: str, func: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        conn = self._connection()
+        self._purge_expired(conn)
+        # BEGIN IMMEDIATE takes the write lock up front so concurrent
+        # read-modify-write cycles from other workers serialise here
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            value = func(self._read(conn, key))
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            # Also covers cancellation, which would otherwise leave the
+            # transaction open on this thread's connection
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+
+_store: Optional[StateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_state_store() -> StateStore:
+    """Return the configured store. STATE_BACKEND is 'memory' or 'sqlite'."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend = os.getenv("STATE_BACKEND", "memory").lower()
+                if backend == "sqlite":
+                    _store = SQLiteStateStore(os.getenv("STATE_DB_PATH", "state/doc2deck_state.db"))
+                elif backend == "memory":
+                    _store = MemoryStateStore()
+                else:
+                    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
+    return _store
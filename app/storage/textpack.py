@@ -0,0 +1,245 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import struct
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.state.files import atomic_write
+
+# File layout:
+#   header  MAGIC, version, dictionary id, entry count, key table length
+#   index   (offset, compressed length) per entry, offsets relative to data start
+#   keys    zlib-compressed JSON list of entry keys
+#   data    each entry compressed on its own, so any one can be read alone
+MAGIC = b"D2DP"
+VERSION = 1
+HEADER = struct.Struct("<4sB16sII")
+INDEX_ENTRY = struct.Struct("<QI")
+NO_DICTIONARY = "0" * 16
+MAX_DICTIONARY_SIZE = 32 * 1024  # zlib only uses the last 32KB of a preset dictionary
+
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """Build a zlib preset dictionary from the phrases most common in samples.
+
+    zlib has no dictionary trainer, so this picks word n-grams that occur in
+    many samples, weighted by how many bytes they would save. The most useful
+    phrases go last, where zlib can reach them with the shortest distances.
+    """
+    counts = Counter()
+    for sample in samples:
+        words = re.findall(r"\S+\s*", sample)
+        seen = set()
+        for n in (1, 2, 3, 4):
+            for i in range(len(words) - n + 1):
+                seen.add("".join(words[i:i + n]))
+        # Count documents, not occurrences, so one long file can't dominate
+        counts.update(seen)
+
+    scored = sorted(
+        (phrase for phrase, count in counts.items() if count > 1 and len(phrase) > 3),
+        key=lambda phrase: counts[phrase] * len(phrase),
+        reverse=True,
+    )
+    chosen = []
+    total = 0
+    for phrase in scored:
+        encoded = phrase.encode("utf-8")
+        if total + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        total += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+def dictionary_id(dictionary: Optional[bytes]) -> str:
+    if not dictionary:
+        return NO_DICTIONARY
+    return hashlib.sha256(dictionary).hexdigest()[:16]
+
+
+def split_notes(notes: str) -> List[Tuple[str, str]]:
+    """Split notes into (heading, chunk) pairs at # and ## headings.
+
+    Chunks keep their heading line and whitespace, so joining them gives
+    back the original notes exactly.
+    """
+    sections = []
+    heading = ""
+    chunk = []
+    for line in notes.splitlines(keepends=True):
+        stripped = line.strip()
+        if (stripped.startswith('# ') or stripped.startswith('## ')) and chunk:
+            sections.append((heading, "".join(chunk)))
+            chunk = []
+        if stripped.startswith('# ') or stripped.startswith('## '):
+            heading = stripped.lstrip('#').strip()
+        chunk.append(line)
+    if chunk:
+        sections.append((heading, "".join(chunk)))
+    return sections
+
+
+def write_pack(path: str, entries: List[Tuple[str, str]], dictionary: Optional[bytes] = None):
+    """Write (key, text) entries to a pack file atomically"""
+    blobs = []
+    for _, text in entries:
+        if dictionary:
+            compressor = zlib.compressobj(level=9, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(level=9)
+        blobs.append(compressor.compress(text.encode("utf-8")) + compressor.flush())
+
+    keys = zlib.compress(json.dumps([key for key, _ in entries]).encode("utf-8"))
+    parts = [HEADER.pack(MAGIC, VERSION, dictionary_id(dictionary).encode("ascii"), len(entries), len(keys))]
+    offset = 0
+    for blob in blobs:
+        parts.append(INDEX_ENTRY.pack(offset, len(blob)))
+        offset += len(blob)
+    parts.append(keys)
+    parts.extend(blobs)
+    atomic_write(path, b"".join(parts))
+
+
+class TextPack:
+    """Read-only view of a pack file with random access to single entries"""
+
+    def __init__(self, path: str, dictionaries: "DictionaryStore"):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, dict_id, count, keys_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Not a text pack: {path}")
+            index = f.read(INDEX_ENTRY.size * count)
+            self.keys: List[str] = json.loads(zlib.decompress(f.read(keys_length)))
+        self.dictionary_id = dict_id.decode("ascii")
+        self._dictionary = dictionaries.load(self.dictionary_id)
+        self._index = [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size) for i in range(count)]
+        self._data_start = HEADER.size + len(index) + keys_length
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def read(self, position: int) -> str:
+        """Decompress a single entry by position"""
+        offset, length = self._index[position]
+        with open(self.path, "rb") as f:
+            f.seek(self._data_start + offset)
+            blob = f.read(length)
+        if self._dictionary:
+            decompressor = zlib.decompressobj(zdict=self._dictionary)
+        else:
+            decompressor = zlib.decompressobj()
+        return (decompressor.decompress(blob) + decompressor.flush()).decode("utf-8")
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.read(self.keys.index(key))
+        except ValueError:
+            return None
+
+    def read_all(self) -> List[str]:
+        return [self.read(i) for i in range(len(self))]
+
+
+class DictionaryStore:
+    """Trained dictionaries, kept forever so older packs stay readable"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._cache: Dict[str, bytes] = {}
+
+    def _path(self, dict_id: str) -> str:
+        return os.path.join(self.directory, f"{dict_id}.zdict")
+
+    def load(self, dict_id: str) -> Optional[bytes]:
+        if dict_id == NO_DICTIONARY:
+            return None
+        if dict_id not in self._cache:
+            with open(self._path(dict_id), "rb") as f:
+                self._cache[dict_id] = f.read()
+        return self._cache[dict_id]
+
+    def current(self) -> Optional[bytes]:
+        """The dictionary new packs are written with, if one has been trained"""
+        try:
+            with open(os.path.join(self.directory, "CURRENT")) as f:
+                return self.load(f.read().strip())
+        except FileNotFoundError:
+            return None
+
+    def save(self, dictionary: bytes) -> str:
+        dict_id = dictionary_id(dictionary)
+        atomic_write(self._path(dict_id), dictionary)
+        atomic_write(os.path.join(self.directory, "CURRENT"), dict_id.encode("ascii"))
+        self._cache[dict_id] = dictionary
+        return dict_id
+
+
+class TextStore:
+    """Compressed storage of per-page extracted text and notes sections"""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("TEXT_STORE_DIR", "uploads/text")
+        os.makedirs(self.directory, exist_ok=True)
+        self.dictionaries = DictionaryStore(os.path.join(self.directory, "dictionaries"))
+
+    def pages_path(self, document_id: str) -> str:
+        return os.path.join(self.directory, f"{document_id}.pages.d2dp")
+
+    def notes_path(self, document_id: str) -> str:
+        return os.path.join(self.directory, f"{document_id}.notes.d2dp")
+
+    def save_pages(self, document_id: str, pages: Dict[int, str]) -> str:
+        """Store extracted text keyed by 1-based page number"""
+        path = self.pages_path(document_id)
+        entries = [(str(number), pages[number]) for number in sorted(pages)]
+        write_pack(path, entries, self.dictionaries.current())
+        return path
+
+    def load_page(self, document_id: str, page_number: int) -> Optional[str]:
+        return TextPack(self.pages_path(document_id), self.dictionaries).get(str(page_number))
+
+    def load_pages(self, document_id: str) -> Dict[int, str]:
+        pack = TextPack(self.pages_path(document_id), self.dictionaries)
+        return {int(key): pack.read(i) for i, key in enumerate(pack.keys)}
+
+    def save_notes(self, document_id: str, notes: str) -> str:
+        """Store notes as one entry per section"""
+        path = self.notes_path(document_id)
+        write_pack(path, split_notes(notes or ""), self.dictionaries.current())
+        return path
+
+    def load_notes_section(self, document_id: str, position: int) -> Tuple[str, str]:
+        pack = TextPack(self.notes_path(document_id), self.dictionaries)
+        if position < 0:
+            raise IndexError(position)
+        return pack.keys[position], pack.read(position)
+
+    def load_notes(self, document_id: str) -> str:
+        return "".join(TextPack(self.notes_path(document_id), self.dictionaries).read_all())
+
+    def delete(self, document_id: str):
+        """Remove both packs of a document, if present"""
+        for path in (self.pages_path(document_id), self.notes_path(document_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def train(self, limit: int = 500) -> Optional[str]:
+        """Train a new dictionary from stored packs and use it for new writes"""
+        samples = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.d2dp")))[-limit:]:
+            samples.extend(TextPack(path, self.dictionaries).read_all())
+        if not samples:
+            return None
+        return self.dictionaries.save(train_dictionary(samples))
+
+
+if __name__ == "__main__":
+    dict_id = TextStore().train()
+    print(f"Trained dictionary {dict_id}" if dict_id else "No stored text to train on")
@@ -1,8 +1,10 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request, Form, File, UploadFile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
+import io
 import os
 from datetime import datetime
 from dotenv import load_dotenv
@@ -13,6 +15,12 @@ from app.auth.auth import AuthService
 from app.pdf.processor import PDFProcessor
 from app.ai.service import AIService
 from app.ppt.generator import PPTGenerator
+from app.ppt.thumbnails import ThumbnailRenderer
+from app.search.index import SearchIndex
+from app.storage.textpack import TextStore
+from app.scheduler.scheduler import Scheduler, RateLimitExceeded
+from app.state.files import atomic_write
+from app.state.store import get_state_store
 
 load_dotenv()
 
@@ -25,9 +33,37 @@ auth_service = AuthService()
 pdf_processor = PDFProcessor()
 ai_service = AIService()
 ppt_generator = PPTGenerator()
+state_store = get_state_store()
+scheduler = Scheduler(state_store)
+search_index = SearchIndex()
+thumbnail_renderer = ThumbnailRenderer(ppt_generator)
+text_store = TextStore()
 
 security = HTTPBearer(auto_error=False)
 
+# Job status only matters while the user is waiting on it
+JOB_TTL = 24 * 60 * 60
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": exc.retry_after_header}
+    )
+
+async def find_presentation(user: User, presentation_id: str = None, with_notes: bool = True):
+    """Fetch one of the user's presentations (the latest if no id is given)"""
+    db = await get_database()
+    if presentation_id:
+        presentation_doc = await db.presentations.find_one({"_id": ObjectId(presentation_id), "user_id": str(user.id)})
+    else:
+        presentation_doc = await db.presentations.find_one({"user_id": str(user.id)}, sort=[("created_at", -1)])
+    # Notes live in the compressed pack; older documents still carry them inline
+    if presentation_doc and with_notes and presentation_doc.get("notes_pack"):
+        presentation_doc["notes"] = await run_in_threadpool(text_store.load_notes, str(presentation_doc["_id"]))
+    return presentation_doc
+
 async def get_current_user(request: Request):
     token = request.cookies.get("access_token")
     if not token:
@@ -96,8 +132,7 @@ async def presentations_page(request: Request, user: User = Depends(get_current_
 
 @app.get("/notes/{presentation_id}", response_class=HTMLResponse)
 async def notes_page_by_id(request: Request, presentation_id: str, user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"_id": ObjectId(presentation_id), "user_id": str(user.id)})
+    presentation_doc = await find_presentation(user, presentation_id)
     if not presentation_doc:
         raise HTTPException(status_code=404, detail="Presentation not found")
     presentation_doc["_id"] = str(presentation_doc["_id"])
@@ -114,31 +149,54 @@ async def upload_pdf(
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files allowed")
     
-    file_path = f"uploads/{user.id}_{file.filename}"
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Refuse an empty budget before paying to parse the PDF for its real cost
+    await run_in_threadpool(scheduler.precheck_budget, user.id)
+    content = await file.read()
+    try:
+        page_count = await run_in_threadpool(pdf_processor.count_pages, io.BytesIO(content), pages)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await run_in_threadpool(scheduler.check_budget, user.id, page_count)
+    
+    # Keyed per upload so concurrent uploads of the same file never overwrite each other
+    presentation_id = ObjectId()
+    file_path = f"uploads/{presentation_id}_{os.path.basename(file.filename)}"
+    atomic_write(file_path, content)
     
-    extracted_text = pdf_processor.extract_text(file_path, pages)
-    notes = await ai_service.generate_notes(extracted_text)
+    async with scheduler.stage("extraction", user.id, page_count):
+        extracted_pages = await run_in_threadpool(pdf_processor.extract_pages, file_path, pages)
+    extracted_text = pdf_processor.join_pages(extracted_pages)
+    async with scheduler.stage("ai", user.id, page_count):
+        notes = await ai_service.generate_notes(extracted_text)
     
     presentation_title = title or f"{file.filename} - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-    presentation = Presentation(
-        user_id=str(user.id),
-        title=presentation_title,
-        notes=notes,
-        pdf_filename=file.filename
-    )
-    
     db = await get_database()
-    result = await db.presentations.insert_one(presentation.dict(by_alias=True, exclude={"id"}))
+    try:
+        text_pack = await run_in_threadpool(text_store.save_pages, str(presentation_id), extracted_pages)
+        notes_pack = await run_in_threadpool(text_store.save_notes, str(presentation_id), notes)
+        presentation = Presentation(
+            user_id=str(user.id),
+            title=presentation_title,
+            pdf_filename=file.filename,
+            pdf_path=file_path,
+            text_pack=text_pack,
+            notes_pack=notes_pack
+        )
+        # Notes are stored in the pack only, not inline in the document
+        document = presentation.dict(by_alias=True, exclude={"id", "notes"})
+        document["_id"] = presentation_id
+        await db.presentations.insert_one(document)
+    except Exception:
+        # Don't leave packs behind for a presentation that was never saved
+        await run_in_threadpool(text_store.delete, str(presentation_id))
+        raise
+    await _index_presentation(str(presentation_id), str(user.id), presentation_title, notes)
     
-    return RedirectResponse(url=f"/notes/{result.inserted_id}", status_code=303)
+    return RedirectResponse(url=f"/notes/{presentation_id}", status_code=303)
 
 @app.get("/notes", response_class=HTMLResponse)
 async def notes_page(request: Request, user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"user_id": str(user.id)}, sort=[("created_at", -1)])
+    presentation_doc = await find_presentation(user)
     if not presentation_doc:
         return RedirectResponse(url="/upload", status_code=303)
     presentation_doc["_id"] = str(presentation_doc["_id"])
@@ -147,37 +205,117 @@ async def notes_page(request: Request, user: User = Depends(get_current_user)):
 
 @app.post("/notes/save")
 async def save_notes(notes: str = Form(...), user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"user_id": str(user.id)}, sort=[("created_at", -1)])
+    presentation_doc = await find_presentation(user, with_notes=False)
     if not presentation_doc:
         raise HTTPException(status_code=404, detail="No presentation found")
     
+    await _store_notes(presentation_doc, notes)
+    return {"status": "saved"}
+
+@app.post("/notes/{presentation_id}/regenerate")
+async def regenerate_notes(presentation_id: str, user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, presentation_id, with_notes=False)
+    if not presentation_doc:
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    if not presentation_doc.get("text_pack"):
+        raise HTTPException(status_code=400, detail="No stored text for this presentation")
+    
+    # Re-run the AI stage from the stored text instead of re-extracting the PDF
+    extracted_pages = await run_in_threadpool(text_store.load_pages, presentation_id)
+    page_count = max(1, len(extracted_pages))
+    await run_in_threadpool(scheduler.check_budget, user.id, page_count)
+    async with scheduler.stage("ai", user.id, page_count):
+        notes = await ai_service.generate_notes(pdf_processor.join_pages(extracted_pages))
+    
+    await _store_notes(presentation_doc, notes)
+    return {"status": "regenerated"}
+
+@app.get("/presentations/{presentation_id}/pages/{page_number}")
+async def get_page_text(presentation_id: str, page_number: int, user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, presentation_id, with_notes=False)
+    if not presentation_doc or not presentation_doc.get("text_pack"):
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    text = await run_in_threadpool(text_store.load_page, presentation_id, page_number)
+    if text is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    return {"page": page_number, "text": text}
+
+@app.get("/presentations/{presentation_id}/sections/{position}")
+async def get_notes_section(presentation_id: str, position: int, user: User = Depends(get_current_user)):
+    """Single notes section; positions match the "section" of /search hits"""
+    presentation_doc = await find_presentation(user, presentation_id, with_notes=False)
+    if not presentation_doc or not presentation_doc.get("notes_pack"):
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    try:
+        heading, text = await run_in_threadpool(text_store.load_notes_section, presentation_id, position)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Section not found")
+    return {"section": position, "heading": heading, "text": text}
+
+async def _store_notes(presentation_doc, notes: str):
+    """Write notes to the pack, drop any inline copy, and reindex them"""
+    db = await get_database()
+    notes_pack = await run_in_threadpool(text_store.save_notes, str(presentation_doc["_id"]), notes)
     await db.presentations.update_one(
         {"_id": presentation_doc["_id"]},
-        {"$set": {"notes": notes}}
+        {"$set": {"notes_pack": notes_pack}, "$unset": {"notes": ""}}
     )
-    return {"status": "saved"}
+    await _index_presentation(str(presentation_doc["_id"]), presentation_doc["user_id"], presentation_doc["title"], notes)
+
+async def _index_presentation(presentation_id: str, user_id: str, title: str, notes: str):
+    """Update the search index; the notes are already saved, so a failure here is only logged"""
+    try:
+        await run_in_threadpool(search_index.index_presentation, presentation_id, user_id, title, notes)
+    except Exception as e:
+        print(f"Search indexing failed for presentation {presentation_id}: {e}")
+
+@app.get("/search")
+async def search(q: str = "", limit: int = 20, user: User = Depends(get_current_user)):
+    limit = max(1, min(limit, 100))
+    results = await run_in_threadpool(search_index.search, str(user.id), q, limit)
+    return {"query": q, "results": results}
 
 @app.post("/generate-ppt")
 async def generate_ppt(user: User = Depends(get_current_user)):
     db = await get_database()
-    presentation_doc = await db.presentations.find_one({"user_id": str(user.id)}, sort=[("created_at", -1)])
+    presentation_doc = await find_presentation(user)
     if not presentation_doc or not presentation_doc.get("notes"):
         raise HTTPException(status_code=400, detail="No notes available")
     
-    ppt_path = ppt_generator.create_presentation(presentation_doc["notes"], str(user.id))
-    feedback = await ai_service.review_presentation(presentation_doc["notes"])
+    cost = scheduler.notes_cost(presentation_doc["notes"])
+    await run_in_threadpool(scheduler.check_budget, user.id, cost)
+    
+    job_key = f"job:generate-ppt:{presentation_doc['_id']}"
+    await run_in_threadpool(state_store.set, job_key, {"status": "running", "presentation_id": str(presentation_doc["_id"])}, JOB_TTL)
+    try:
+        async with scheduler.stage("rendering", user.id, cost):
+            ppt_path = await run_in_threadpool(ppt_generator.create_presentation, presentation_doc["notes"], str(presentation_doc["_id"]))
+        await db.presentations.update_one({"_id": presentation_doc["_id"]}, {"$set": {"ppt_path": ppt_path}})
+        thumbnail_renderer.schedule(presentation_doc["notes"])
+        async with scheduler.stage("ai", user.id, cost):
+            feedback = await ai_service.review_presentation(presentation_doc["notes"])
+    except Exception:
+        await run_in_threadpool(state_store.set, job_key, {"status": "failed", "presentation_id": str(presentation_doc["_id"])}, JOB_TTL)
+        raise
+    await run_in_threadpool(state_store.set, job_key, {"status": "done", "presentation_id": str(presentation_doc["_id"]), "ppt_path": ppt_path}, JOB_TTL)
     
     return {"ppt_path": ppt_path, "feedback": feedback}
 
+@app.get("/generate-ppt/status")
+async def generate_ppt_status(presentation_id: str = None, user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, presentation_id, with_notes=False)
+    if not presentation_doc:
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    job_key = f"job:generate-ppt:{presentation_doc['_id']}"
+    return await run_in_threadpool(state_store.get, job_key, {"status": "idle"})
+
 @app.get("/ppt-review", response_class=HTMLResponse)
 async def ppt_review_page(request: Request, user: User = Depends(get_current_user)):
     return templates.TemplateResponse("ppt_review.html", {"request": request, "user": user})
 
 @app.get("/view-ppt", response_class=HTMLResponse)
 async def view_ppt_page(request: Request, user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"user_id": str(user.id)}, sort=[("created_at", -1)])
+    presentation_doc = await find_presentation(user)
     if not presentation_doc:
         return RedirectResponse(url="/upload", status_code=303)
     presentation_doc["_id"] = str(presentation_doc["_id"])
@@ -186,8 +324,7 @@ async def view_ppt_page(request: Request, user: User = Depends(get_current_user)
 
 @app.get("/view-ppt/{presentation_id}", response_class=HTMLResponse)
 async def view_ppt_by_id(request: Request, presentation_id: str, user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"_id": ObjectId(presentation_id), "user_id": str(user.id)})
+    presentation_doc = await find_presentation(user, presentation_id)
     if not presentation_doc:
         raise HTTPException(status_code=404, detail="Presentation not found")
     presentation_doc["_id"] = str(presentation_doc["_id"])
@@ -196,8 +333,7 @@ async def view_ppt_by_id(request: Request, presentation_id: str, user: User = De
 
 @app.get("/present-ppt", response_class=HTMLResponse)
 async def present_ppt_page(request: Request, user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"user_id": str(user.id)}, sort=[("created_at", -1)])
+    presentation_doc = await find_presentation(user)
     if not presentation_doc:
         return RedirectResponse(url="/upload", status_code=303)
     presentation_doc["_id"] = str(presentation_doc["_id"])
@@ -206,21 +342,66 @@ async def present_ppt_page(request: Request, user: User = Depends(get_current_us
 
 @app.get("/present-ppt/{presentation_id}", response_class=HTMLResponse)
 async def present_ppt_by_id(request: Request, presentation_id: str, user: User = Depends(get_current_user)):
-    db = await get_database()
-    presentation_doc = await db.presentations.find_one({"_id": ObjectId(presentation_id), "user_id": str(user.id)})
+    presentation_doc = await find_presentation(user, presentation_id)
     if not presentation_doc:
         raise HTTPException(status_code=404, detail="Presentation not found")
     presentation_doc["_id"] = str(presentation_doc["_id"])
     presentation = Presentation(**presentation_doc)
     return templates.TemplateResponse("present_ppt.html", {"request": request, "user": user, "presentation": presentation})
 
-@app.get("/download-ppt")
-async def download_ppt(user: User = Depends(get_current_user)):
-    ppt_path = f"uploads/presentation_{user.id}.pptx"
-    if os.path.exists(ppt_path):
+@app.get("/thumbnails/{presentation_id}")
+async def list_thumbnails(presentation_id: str, user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, presentation_id)
+    if not presentation_doc:
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    # Only hand out URLs; get_thumbnail renders misses lazily through the rendering stage
+    slides = thumbnail_renderer.slides(presentation_doc.get("notes") or "")
+    return {"slides": [
+        {"index": i, "url": f"/thumbnails/{presentation_id}/{i}/{slide['hash']}.{thumbnail_renderer.extension}"}
+        for i, slide in enumerate(slides)
+    ]}
+
+@app.get("/thumbnails/{presentation_id}/{index}/{filename}")
+async def get_thumbnail(presentation_id: str, index: int, filename: str, user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, presentation_id)
+    if not presentation_doc:
+        raise HTTPException(status_code=404, detail="Presentation not found")
+    slide_hash = filename.rsplit(".", 1)[0]
+    slides = thumbnail_renderer.slides(presentation_doc.get("notes") or "")
+    if index < 0 or index >= len(slides) or slides[index]["hash"] != slide_hash:
+        raise HTTPException(status_code=404, detail="Slide not found")
+    path = thumbnail_renderer.path_for(slide_hash)
+    if not os.path.exists(path):
+        # Not rendered yet (or rendered by another worker's pool)
+        async with scheduler.stage("rendering", user.id):
+            path = await thumbnail_renderer.ensure(slide_hash, slides[index]["spec"])
+    # URLs are content-addressed, so a given URL never changes
+    return FileResponse(
+        path,
+        media_type=thumbnail_renderer.media_type,
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
+
+def _ppt_download(presentation_doc, user: User):
+    ppt_path = presentation_doc.get("ppt_path") if presentation_doc else None
+    if ppt_path and os.path.exists(ppt_path):
         return FileResponse(ppt_path, filename=f"{user.username}_presentation.pptx")
     raise HTTPException(status_code=404, detail="Presentation not found")
 
+@app.get("/download-ppt")
+async def download_ppt(user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, with_notes=False)
+    return _ppt_download(presentation_doc, user)
+
+@app.get("/download-ppt/{presentation_id}")
+async def download_ppt_by_id(presentation_id: str, user: User = Depends(get_current_user)):
+    presentation_doc = await find_presentation(user, presentation_id, with_notes=False)
+    return _ppt_download(presentation_doc, user)
+
+@app.get("/metrics/ai-routing")
+async def ai_routing_metrics(user: User = Depends(get_current_user)):
+    return ai_service.router.metrics()
+
 @app.get("/logout")
 async def logout():
     response = RedirectResponse(url="/", status_code=303)
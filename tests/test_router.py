@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("requests")
+
+from app.ai import router as router_module
+from app.ai.router import LLMRouter
+
+
+class FakeBackends:
+    """Stands in for LLMRouter._post: each backend sleeps, then answers or fails"""
+
+    def __init__(self, **behaviour):
+        self.behaviour = behaviour
+        self.started = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, backend, prompt, api_key):
+        with self._lock:
+            self.calls.append(backend.name)
+            self.started.setdefault(backend.name, time.monotonic())
+        delay, result = self.behaviour[backend.name]
+        time.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def make_router(monkeypatch, fake, models="a,b"):
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-key")
+    monkeypatch.setenv("OPENROUTER_MODELS", models)
+    router = LLMRouter()
+    router.hedge_min = 0.05
+    router.hedge_default = 0.05
+    router.timeout = 2.0
+    router.failure_threshold = 2
+    monkeypatch.setattr(router, "_post", fake)
+    return router
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_fast_primary_is_not_hedged(monkeypatch):
+    fake = FakeBackends(a=(0.0, "from a"), b=(0.0, "from b"))
+    router = make_router(monkeypatch, fake)
+
+    assert asyncio.run(router.complete("prompt")) == "from a"
+    assert fake.calls == ["a"]
+    assert router.decisions["winner:a"] == 1
+
+
+def test_slow_primary_is_hedged_after_its_delay(monkeypatch):
+    fake = FakeBackends(a=(0.5, "from a"), b=(0.0, "from b"))
+    router = make_router(monkeypatch, fake)
+
+    assert asyncio.run(router.complete("prompt")) == "from b"
+    assert fake.started["b"] - fake.started["a"] >= 0.05
+    assert router.decisions["hedge:b"] == 1
+    assert router.decisions["winner:b"] == 1
+
+
+def test_failure_fails_over_without_waiting_for_hedge_delay(monkeypatch):
+    fake = FakeBackends(a=(0.0, RuntimeError("boom")), b=(0.0, "from b"))
+    router = make_router(monkeypatch, fake)
+    router.hedge_default = 1.0
+
+    start = time.monotonic()
+    assert asyncio.run(router.complete("prompt")) == "from b"
+    assert time.monotonic() - start < 0.5
+    assert router.decisions["failover:b"] == 1
+    wait_until(lambda: router.backends[0].consecutive_failures == 1)
+
+
+def test_local_engine_is_the_final_hedge(monkeypatch):
+    fake = FakeBackends(a=(0.5, "from a"), b=(0.5, "from b"))
+    router = make_router(monkeypatch, fake)
+
+    start = time.monotonic()
+    assert asyncio.run(router.complete("prompt")) is None
+    # Gives up once b passes its hedge delay, well before the timeout
+    assert time.monotonic() - start < 0.4
+    assert router.decisions["local:hedge"] == 1
+
+
+def test_backends_are_ranked_by_error_rate_then_latency(monkeypatch):
+    fake = FakeBackends(a=(0.0, "from a"), b=(0.0, "from b"), c=(0.0, "from c"))
+    router = make_router(monkeypatch, fake, models="a,b,c")
+    a, b, c = router.backends
+    router.failure_threshold = 10
+    a.record_failure(router.failure_threshold)
+    for _ in range(5):
+        b.record_success(0.3)
+        c.record_success(0.1)
+
+    assert asyncio.run(router.complete("prompt")) == "from c"
+    assert fake.calls == ["c"]
+
+
+def test_circuit_opens_then_half_open_allows_a_single_probe(monkeypatch):
+    fake = FakeBackends(a=(0.0, RuntimeError("boom")))
+    router = make_router(monkeypatch, fake, models="a")
+    backend = router.backends[0]
+
+    for _ in range(2):
+        assert asyncio.run(router.complete("prompt")) is None
+        wait_until(lambda: len(backend.outcomes) == len(fake.calls))
+    assert backend.circuit_state(router.cooldown) == "open"
+
+    # Open: the backend isn't called at all
+    assert asyncio.run(router.complete("prompt")) is None
+    assert fake.calls == ["a", "a"]
+    assert router.decisions["skip_open_circuit:a"] == 1
+
+    # Half-open: one probe goes through, a concurrent request stays local
+    opened_at = backend.opened_at
+    monkeypatch.setattr(router_module.time, "time", lambda: opened_at + router.cooldown)
+    fake.behaviour["a"] = (0.1, "recovered")
+    router.hedge_default = 1.0
+
+    async def main():
+        probe = asyncio.create_task(router.complete("prompt"))
+        await asyncio.sleep(0.02)
+        concurrent = await router.complete("prompt")
+        return await probe, concurrent
+
+    assert asyncio.run(main()) == ("recovered", None)
+    assert fake.calls == ["a", "a", "a"]
+    assert router.decisions["skip_probe_in_flight:a"] == 1
+    wait_until(lambda: backend.circuit_state(router.cooldown) == "closed")
+    assert not backend.probing
+
+
+def test_probe_is_released_when_cancelled_before_it_runs(monkeypatch):
+    fake = FakeBackends(a=(0.0, "from a"))
+    router = make_router(monkeypatch, fake, models="a")
+    backend = router.backends[0]
+    backend.consecutive_failures = 2
+    backend.opened_at = time.time() - router.cooldown - 1
+
+    # Keep the only worker busy so the probe is still queued when cancelled
+    router.executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    router.executor.submit(release.wait)
+
+    async def main():
+        task = asyncio.create_task(router.complete("prompt"))
+        await asyncio.sleep(0.02)
+        assert backend.probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        # Released by complete() itself, not by the loop shutting down
+        assert not backend.probing
+
+    try:
+        asyncio.run(main())
+    finally:
+        release.set()
+    assert not backend.probing
+    assert fake.calls == []
+    assert backend.circuit_state(router.cooldown) == "half_open"
+
+
+def test_late_success_from_losing_hedge_closes_circuit(monkeypatch):
+    # Intended: any answer shows the backend is serving again
+    gate = threading.Event()
+    fake = FakeBackends(a=(0.0, "late a"), b=(0.0, "from b"))
+    slow = fake.__call__
+
+    def gated(backend, prompt, api_key):
+        if backend.name == "a":
+            gate.wait(2)
+        return slow(backend, prompt, api_key)
+
+    router = make_router(monkeypatch, fake)
+    monkeypatch.setattr(router, "_post", gated)
+    a = router.backends[0]
+
+    assert asyncio.run(router.complete("prompt")) == "from b"
+
+    # Other requests trip a's circuit while the losing call is still running
+    a.record_failure(router.failure_threshold)
+    a.record_failure(router.failure_threshold)
+    assert a.circuit_state(router.cooldown) == "open"
+
+    gate.set()
+    wait_until(lambda: a.circuit_state(router.cooldown) == "closed")
+    assert a.consecutive_failures == 0
@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+
+from app.scheduler import scheduler as scheduler_module
+from app.scheduler.scheduler import FairStage, RateLimitExceeded, TokenBucket
+from app.state.store import MemoryStateStore, SQLiteStateStore
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler_module.time, "time", fake)
+    return fake
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStateStore(str(tmp_path / "state.db"))
+    return MemoryStateStore()
+
+
+def test_bucket_rejects_when_empty_with_retry_after(store, clock):
+    bucket = TokenBucket(store, capacity=10, refill_per_second=1)
+    bucket.take("alice", 8)
+
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        bucket.take("alice", 5)
+
+    assert excinfo.value.retry_after == pytest.approx(3)
+    assert excinfo.value.retry_after_header == "3"
+
+
+def test_bucket_refills_over_time(store, clock):
+    bucket = TokenBucket(store, capacity=10, refill_per_second=1)
+    bucket.take("alice", 10)
+    with pytest.raises(RateLimitExceeded):
+        bucket.take("alice", 4)
+
+    clock.now += 4
+    bucket.take("alice", 4)
+
+    # Refill is capped at capacity however long the bucket sat idle
+    clock.now += 1000
+    bucket.take("alice", 10)
+    with pytest.raises(RateLimitExceeded):
+        bucket.take("alice", 1)
+
+
+def test_bucket_is_per_user_and_clamps_oversized_cost(store, clock):
+    bucket = TokenBucket(store, capacity=10, refill_per_second=1)
+    bucket.take("alice", 50)
+    bucket.take("bob", 10)
+    with pytest.raises(RateLimitExceeded):
+        bucket.take("alice", 1)
+
+
+def test_bucket_check_rejects_without_consuming(store, clock):
+    bucket = TokenBucket(store, capacity=10, refill_per_second=1)
+    bucket.check("alice")
+    bucket.take("alice", 9.5)
+
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        bucket.check("alice")
+    assert excinfo.value.retry_after == pytest.approx(0.5)
+
+    # Checking repeatedly never drains the bucket
+    clock.now += 1
+    for _ in range(5):
+        bucket.check("alice")
+    bucket.take("alice", 1.5)
+
+
+def test_retry_after_header_is_at_least_one_second():
+    assert RateLimitExceeded(0.2).retry_after_header == "1"
+    assert RateLimitExceeded(2.1).retry_after_header == "3"
+
+
+def test_fair_stage_serves_cheap_user_before_heavy_backlog():
+    order = []
+
+    async def job(stage, user_id, cost):
+        async with stage.slot(user_id, cost):
+            order.append(user_id)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        stage = FairStage("extraction", 1)
+        tasks = [asyncio.create_task(job(stage, "heavy", 10)) for _ in range(4)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(job(stage, "light", 1)) for _ in range(2)]
+        await asyncio.gather(*tasks)
+        return stage
+
+    stage = asyncio.run(main())
+
+    assert order == ["heavy", "light", "light", "heavy", "heavy", "heavy"]
+    assert stage._active == 0
+
+
+def test_fair_stage_respects_concurrency_cap():
+    running = 0
+    peak = 0
+
+    async def job(stage):
+        nonlocal running, peak
+        async with stage.slot("alice"):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def main():
+        stage = FairStage("ai", 2)
+        await asyncio.gather(*(job(stage) for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_cancelled_waiter_is_skipped():
+    async def main():
+        stage = FairStage("rendering", 1)
+        await stage.acquire("a", 1)
+        waiting = asyncio.create_task(stage.acquire("b", 1))
+        after = asyncio.create_task(stage.acquire("c", 1))
+        await asyncio.sleep(0)
+
+        waiting.cancel()
+        await asyncio.sleep(0)
+        stage.release()
+        await asyncio.wait_for(after, 1)
+        return stage, waiting
+
+    stage, waiting = asyncio.run(main())
+    assert waiting.cancelled()
+    assert stage._active == 1
+    assert stage.queued == 0
+
+
+def test_slot_handed_to_cancelled_task_is_passed_on():
+    async def main():
+        stage = FairStage("rendering", 1)
+        await stage.acquire("a", 1)
+        handed_over = asyncio.create_task(stage.acquire("b", 1))
+        after = asyncio.create_task(stage.acquire("c", 1))
+        await asyncio.sleep(0)
+
+        # The slot goes to b, which is cancelled before it gets to run
+        stage.release()
+        handed_over.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await handed_over
+
+        await asyncio.wait_for(after, 1)
+        return stage
+
+    stage = asyncio.run(main())
+    assert stage._active == 1
+    assert stage.queued == 0
@@ -0,0 +1,78 @@
+from app.search.index import SearchIndex
+from app.storage.textpack import NO_DICTIONARY, TextPack, TextStore, split_notes, train_dictionary
+
+NOTES = "\n# Study Notes\n\nIntro text.\n\n## Cells\n\nThe cell membrane controls transport.\n\n## Energy\n\nMitochondria produce energy.\n"
+
+
+def test_split_notes_round_trips_exactly():
+    sections = split_notes(NOTES)
+
+    assert "".join(chunk for _, chunk in sections) == NOTES
+    assert [heading for heading, _ in sections] == ["", "Study Notes", "Cells", "Energy"]
+
+
+def test_pages_and_sections_are_readable_individually(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.save_pages("doc", {1: "first page", 3: "third page"})
+    store.save_notes("doc", NOTES)
+
+    assert store.load_page("doc", 3) == "third page"
+    assert store.load_page("doc", 2) is None
+    assert store.load_pages("doc") == {1: "first page", 3: "third page"}
+    assert store.load_notes_section("doc", 2) == ("Cells", "## Cells\n\nThe cell membrane controls transport.\n\n")
+    assert store.load_notes("doc") == NOTES
+
+
+def test_trained_dictionary_is_used_and_old_packs_stay_readable(tmp_path):
+    store = TextStore(str(tmp_path))
+    for i in range(5):
+        store.save_notes(f"doc{i}", NOTES)
+
+    dict_id = store.train()
+    store.save_notes("new", NOTES)
+
+    assert dict_id is not None and dict_id != NO_DICTIONARY
+    assert TextPack(store.notes_path("new"), store.dictionaries).dictionary_id == dict_id
+    assert TextPack(store.notes_path("doc0"), store.dictionaries).dictionary_id == NO_DICTIONARY
+    assert store.load_notes("doc0") == NOTES
+    assert store.load_notes("new") == NOTES
+
+
+def test_training_without_samples_gives_empty_dictionary():
+    assert train_dictionary([]) == b""
+
+
+def test_delete_removes_packs(tmp_path):
+    store = TextStore(str(tmp_path))
+    store.save_pages("doc", {1: "text"})
+    store.save_notes("doc", NOTES)
+
+    store.delete("doc")
+
+    assert not (tmp_path / "doc.pages.d2dp").exists()
+    assert not (tmp_path / "doc.notes.d2dp").exists()
+
+
+def test_search_hit_section_matches_notes_pack(tmp_path):
+    store = TextStore(str(tmp_path / "text"))
+    index = SearchIndex(str(tmp_path / "search.db"))
+    store.save_notes("doc", NOTES)
+    index.index_presentation("doc", "user", "Biology", NOTES)
+
+    hit = index.search("user", "mitochondria")[0]
+
+    assert store.load_notes_section("doc", hit["section"])[0] == "Energy"
+
+
+def test_title_match_is_a_single_hit(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.db"))
+    index.index_presentation("doc", "user", "Biology", NOTES)
+    index.index_presentation("other", "user", "Chemistry", "")
+
+    hits = index.search("user", "biology")
+
+    assert [(hit["presentation_id"], hit["section"]) for hit in hits] == [("doc", -1)]
+    assert hits[0]["snippet"] == "<mark>Biology</mark>"
+    # Presentations without notes stay findable by title
+    assert index.search("user", "chem")[0]["presentation_id"] == "other"
+    assert index.search("someone-else", "biology") == []
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("pptx")
+
+from app.ppt.generator import PPTGenerator
+from app.ppt.thumbnails import ThumbnailRenderer
+
+NOTES = (
+    "# Study Notes\n\nIntro text.\n\n"
+    "## Cells\n\n- Membrane\n- Nucleus\n\nCells are the unit of life.\n\n"
+    "Loose paragraph without a heading.\n"
+)
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    return ThumbnailRenderer(PPTGenerator(), str(tmp_path))
+
+
+def test_slide_specs_follow_parsed_slides():
+    generator = PPTGenerator()
+    parsed = generator._parse_notes_to_slides(NOTES)
+    specs = generator.slide_specs(NOTES)
+
+    assert specs[0]["layout"] == "title"
+    assert len(specs) == len(parsed) + 1
+    for spec, slide in zip(specs[1:], parsed):
+        assert spec["layout"] == "content"
+        assert spec["title"] == (slide["title"] or "Content")
+        assert [p["text"] for p in spec["paragraphs"]] == [
+            p["text"] for p in generator._content_paragraphs(slide["content"])
+        ]
+
+
+def test_slide_hash_is_stable_and_content_addressed(renderer, tmp_path):
+    slides = renderer.slides(NOTES)
+    again = ThumbnailRenderer(PPTGenerator(), str(tmp_path / "other")).slides(NOTES)
+
+    assert [s["hash"] for s in slides] == [s["hash"] for s in again]
+    # Key order doesn't matter, content does
+    spec = slides[1]["spec"]
+    assert renderer.slide_hash(dict(reversed(list(spec.items())))) == slides[1]["hash"]
+    assert renderer.slide_hash({**spec, "title": "Other"}) != slides[1]["hash"]
+
+    # Editing one section only changes the hashes of its slide
+    edited = renderer.slides(NOTES.replace("Nucleus", "Ribosome"))
+    changed = [i for i, (a, b) in enumerate(zip(slides, edited)) if a["hash"] != b["hash"]]
+    assert changed == [2]